@@ -1,21 +1,31 @@
 import os
-import random
 import asyncio
+import functools
+import signal
 import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
+from telegram.ext import (
+    Application, CommandHandler, ContextTypes, CallbackQueryHandler,
+    TypeHandler, ApplicationHandlerStop
+)
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import pytz
 import logging
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, IntegrityError
+from telegram.error import BadRequest, TelegramError
 
 from models import (
     init_db, get_db, User, Season, SeasonStats, 
-    CommandUsage, SeasonControl, SessionLocal
+    CommandUsage, SeasonControl, DailySelection, SelectionSalt, SessionLocal, engine
+)
+from selection import (
+    make_seed, pick_index, encode_roster, generate_salt, verify_selection,
+    FAIRNESS_WEIGHTING, SELECTION_SALT
 )
+from throttle import Throttle
 
 load_dotenv()
 
@@ -30,6 +40,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+SUSPENSE_DELAY = 1.5
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '10'))
+
+# Последний кадр интриги объединен с результатом, чтобы не тратить на него отдельный запрос к API
+ANNOUNCEMENTS = {
+    '/run': "Сектор приз на барабане🎯\n🎉Красавчик сегодня - {name}🥳",
+    '/pidor': "Твой🫵профиль в соцсетях👥проАНАЛизирован😨\n🏳️‍🌈Сегодня ПИДОР ДНЯ - {name}👬",
+}
+# Для выборов прошлых дней, объявленных после перезапуска
+PAST_ANNOUNCEMENTS = {
+    '/run': "🎉Красавчик дня за {day} - {name}🥳",
+    '/pidor': "🏳️‍🌈ПИДОР ДНЯ за {day} - {name}👬",
+}
+
+# Лимиты частоты: (сколько запросов подряд, за сколько секунд восстанавливаются)
+# Нажатия на кнопки выбора сезона считаются как команда 'callback'
+THROTTLE_USER_LIMITS = {
+    '/stats': (2, 60),
+    '/sostats': (2, 60),
+    '/seasons': (2, 60),
+    '/soseasons': (2, 60),
+    'callback': (5, 30),
+}
+THROTTLE_CHAT_LIMITS = {
+    '/stats': (4, 60),
+    '/sostats': (4, 60),
+    '/seasons': (4, 60),
+    '/soseasons': (4, 60),
+    'callback': (15, 30),
+}
+THROTTLE_DEFAULT_LIMIT = (5, 60)
+
+throttle = Throttle(THROTTLE_USER_LIMITS, THROTTLE_CHAT_LIMITS, THROTTLE_DEFAULT_LIMIT)
+
+# Выставляется при остановке бота, чтобы анимации интриги завершались досрочно
+shutdown_event = asyncio.Event()
+suspense_tasks = set()
+# id выборов, которые сейчас объявляет обработчик в этом процессе
+active_selections = set()
+# Обработчики выбора, которые нужно дождаться (или отменить по таймауту) при остановке
+inflight_tasks = set()
+
 def wait_for_db(max_attempts=5, initial_delay=1):
     """Ждет подключения к базе данных с экспоненциальной задержкой"""
     attempt = 0
@@ -52,6 +104,96 @@ def wait_for_db(max_attempts=5, initial_delay=1):
 
     return False
 
+async def sleep_unless_shutdown(delay: float) -> bool:
+    """Спит delay секунд. Возвращает True, если сон прерван остановкой бота"""
+    try:
+        await asyncio.wait_for(shutdown_event.wait(), timeout=delay)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def save_selection_message(selection_id: int, message_id: int):
+    """Сохраняет сообщение интриги, чтобы после перезапуска записать результат в него же"""
+    db = SessionLocal()
+    try:
+        db.query(DailySelection).filter(DailySelection.id == selection_id).update(
+            {DailySelection.message_id: message_id}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+async def play_suspense(context: ContextTypes.DEFAULT_TYPE, chat_id: int, messages: list, selection_id: int):
+    """
+    Показывает сообщения интриги, редактируя одно и то же сообщение.
+    Возвращает это сообщение, чтобы в него же можно было записать результат,
+    который заменяет последний кадр (см. ANNOUNCEMENTS).
+    """
+    message = await context.bot.send_message(chat_id=chat_id, text=messages[0])
+    await save_selection_message(selection_id, message.message_id)
+    if await sleep_unless_shutdown(SUSPENSE_DELAY):
+        return message
+
+    for text in messages[1:]:
+        try:
+            message = await message.edit_text(text)
+        except TelegramError as e:
+            # Кадры интриги - только украшение, результат все равно будет объявлен
+            logger.warning(f"Suspense frame edit failed in chat {chat_id}: {e}")
+            break
+        if await sleep_unless_shutdown(SUSPENSE_DELAY):
+            break
+    return message
+
+def start_suspense(context: ContextTypes.DEFAULT_TYPE, chat_id: int, messages: list, selection_id: int) -> asyncio.Task:
+    """Запускает анимацию интриги отдельной задачей, которую можно отменить при остановке"""
+    task = asyncio.create_task(play_suspense(context, chat_id, messages, selection_id))
+    suspense_tasks.add(task)
+    task.add_done_callback(suspense_tasks.discard)
+    return task
+
+async def throttle_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отбрасывает слишком частые команды и нажатия до того, как они дойдут до базы"""
+    if update.effective_chat is None:
+        return
+
+    if update.callback_query:
+        command = 'callback'
+    elif update.effective_message and update.effective_message.text and update.effective_message.text.startswith('/'):
+        command, _, bot_username = update.effective_message.text.split()[0].partition('@')
+        # Команды, адресованные другим ботам (/stats@OtherBot), CommandHandler все равно пропустит
+        if bot_username and bot_username.lower() != (context.bot.username or '').lower():
+            return
+        command = command.lower()
+    else:
+        return
+
+    user_id = update.effective_user.id if update.effective_user else None
+    if throttle.allow(command, update.effective_chat.id, user_id):
+        return
+
+    logger.info(f"Throttled {command} in chat {update.effective_chat.id} from user {user_id}")
+    if update.callback_query:
+        # Убираем часики на кнопке, но сообщение не трогаем
+        try:
+            await update.callback_query.answer("Слишком часто, подождите немного")
+        except TelegramError as e:
+            # Ошибка ответа не должна пропустить нажатие дальше к обработчикам
+            logger.warning(f"Failed to answer throttled callback: {e}")
+    raise ApplicationHandlerStop
+
+def track_inflight(handler):
+    """Регистрирует задачу обработчика, чтобы при остановке дождаться ее или отменить по таймауту"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        task = asyncio.current_task()
+        inflight_tasks.add(task)
+        try:
+            return await handler(update, context)
+        finally:
+            inflight_tasks.discard(task)
+    return wrapper
+
 async def check_command_cooldown(chat_id: int, command: str, cooldown_hours: int, user_id: int = None) -> bool:
     db = SessionLocal()
     try:
@@ -87,57 +229,143 @@ async def check_command_cooldown(chat_id: int, command: str, cooldown_hours: int
     finally:
         db.close()
 
+def record_command_usage(db: Session, chat_id: int, command: str, user_id: int = None, used_at: datetime = None):
+    """
+    Записывает использование команды в текущую транзакцию без коммита.
+    used_at позволяет записать время выбора, объявленного позже (например, после перезапуска).
+    """
+    # Для /sosal и /nesosal обновляем использование для конкретного пользователя
+    if command in ['/sosal', '/nesosal']:
+        usage = db.query(CommandUsage).filter(
+            CommandUsage.chat_id == chat_id,
+            CommandUsage.command == command,
+            CommandUsage.user_id == user_id
+        ).first()
+    else:
+        # Для остальных команд обновляем использование для всего чата
+        usage = db.query(CommandUsage).filter(
+            CommandUsage.chat_id == chat_id,
+            CommandUsage.command == command
+        ).first()
+
+    used_at = used_at or datetime.now(MOSCOW_TZ)
+    if usage:
+        # Более позднее использование не перетираем более старым
+        if usage.last_used < used_at:
+            usage.last_used = used_at
+    else:
+        usage = CommandUsage(
+            chat_id=chat_id,
+            command=command,
+            last_used=used_at,
+            user_id=user_id if command in ['/sosal', '/nesosal'] else None
+        )
+        db.add(usage)
+
 async def update_command_usage(chat_id: int, command: str, user_id: int = None):
     db = SessionLocal()
     try:
-        # Для /sosal и /nesosal обновляем использование для конкретного пользователя
-        if command in ['/sosal', '/nesosal']:
-            usage = db.query(CommandUsage).filter(
-                CommandUsage.chat_id == chat_id,
-                CommandUsage.command == command,
-                CommandUsage.user_id == user_id
-            ).first()
-        else:
-            # Для остальных команд обновляем использование для всего чата
-            usage = db.query(CommandUsage).filter(
-                CommandUsage.chat_id == chat_id,
-                CommandUsage.command == command
-            ).first()
+        record_command_usage(db, chat_id, command, user_id)
+        db.commit()
+    finally:
+        db.close()
 
-        moscow_now = datetime.now(MOSCOW_TZ)
-        if usage:
-            usage.last_used = moscow_now
-        else:
-            usage = CommandUsage(
-                chat_id=chat_id,
-                command=command,
-                last_used=moscow_now,
-                user_id=user_id if command in ['/sosal', '/nesosal'] else None
-            )
-            db.add(usage)
-        
+def get_selection_salt(db: Session) -> SelectionSalt:
+    """
+    Возвращает текущую соль выбора: из SELECTION_SALT, если она задана, иначе последнюю
+    сохраненную или новую сгенерированную. Все соли хранятся, чтобы старые выборы проверялись.
+    """
+    if SELECTION_SALT:
+        salt = db.query(SelectionSalt).filter(SelectionSalt.salt == SELECTION_SALT).first()
+    else:
+        salt = db.query(SelectionSalt).order_by(SelectionSalt.id.desc()).first()
+
+    if not salt:
+        salt = SelectionSalt(salt=SELECTION_SALT or generate_salt(), created_at=datetime.now(MOSCOW_TZ))
+        db.add(salt)
         db.commit()
+    return salt
+
+def verify_daily_selection(selection_id: int) -> bool:
+    """Проверяет сохраненный выбор с той солью, которая действовала в момент выбора"""
+    db = SessionLocal()
+    try:
+        selection = db.get(DailySelection, selection_id)
+        salt = db.get(SelectionSalt, selection.salt_id)
+        return verify_selection(selection, salt.salt)
     finally:
         db.close()
 
-async def get_random_user(update: Update) -> tuple:
+async def select_daily_user(update: Update, command: str):
+    """
+    Детерминированно выбирает участника чата на текущий день.
+    Сид выводится из чата, команды и даты, а сам выбор сохраняется в DailySelection
+    со статусом pending, чтобы его можно было объявить после перезапуска
+    и воспроизвести через verify_daily_selection.
+    Возвращает (id записи DailySelection, создана ли запись этим вызовом)
+    или (None, False), если выбирать не из кого.
+    """
+    chat_id = update.effective_chat.id
     chat_members = await update.effective_chat.get_member_count()
     if chat_members <= 1:
-        return None, None
+        return None, False
 
-    while True:
-        random_offset = random.randint(0, chat_members - 1)
+    administrators = await update.effective_chat.get_administrators()
+    # Сортируем по id, чтобы порядок кандидатов не зависел от ответа API
+    candidates = sorted((member.user for member in administrators if not member.user.is_bot), key=lambda u: u.id)
+    if not candidates:
+        return None, False
+
+    moscow_now = datetime.now(MOSCOW_TZ)
+    today = moscow_now.date()
+    count_column = User.run_count if command == '/run' else User.pidor_count
+
+    db = SessionLocal()
+    try:
+        selection_filter = (
+            DailySelection.chat_id == chat_id,
+            DailySelection.command == command,
+            DailySelection.day == today
+        )
+        selection = db.query(DailySelection).filter(*selection_filter).first()
+        if selection:
+            return selection.id, False
+
+        user_ids = [user.id for user in candidates]
+        past_counts = dict(db.query(User.user_id, count_column).filter(User.user_id.in_(user_ids)).all())
+        counts = tuple(past_counts.get(user_id) or 0 for user_id in user_ids)
+
+        salt = get_selection_salt(db)
+        seed = make_seed(salt.salt, chat_id, command, today)
+        winner = candidates[pick_index(seed, counts, FAIRNESS_WEIGHTING)]
+        # Используем username если есть, иначе first_name
+        display_name = winner.username if winner.username else winner.first_name
+
+        selection = DailySelection(
+            chat_id=chat_id,
+            command=command,
+            day=today,
+            seed=seed,
+            salt_id=salt.id,
+            roster=encode_roster(user_ids, counts),
+            weighted=FAIRNESS_WEIGHTING,
+            user_id=winner.id,
+            username=display_name,
+            status='pending',
+            created_at=moscow_now
+        )
+        db.add(selection)
         try:
-            member = await update.effective_chat.get_member(
-                user_id=(await update.effective_chat.get_administrators())[random_offset].user.id
-            )
-            user = member.user
-            if not user.is_bot:
-                # Используем username если есть, иначе first_name
-                display_name = user.username if user.username else user.first_name
-                return user.id, display_name
-        except IndexError:
-            continue
+            db.commit()
+        except IntegrityError:
+            # Параллельный вызов уже записал выбор на сегодня
+            db.rollback()
+            return db.query(DailySelection).filter(*selection_filter).first().id, False
+
+        logger.info(f"Selection {command} in chat {chat_id} for {today}: seed={seed}, user_id={winner.id}")
+        return selection.id, True
+    finally:
+        db.close()
 
 async def ensure_season_exists(db: Session) -> SeasonControl:
     """
@@ -158,143 +386,195 @@ async def ensure_season_exists(db: Session) -> SeasonControl:
         db.commit()
     return season_control
 
-async def run_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not await check_command_cooldown(update.effective_chat.id, '/run', 24):
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="Красавчик уже был выбран сегодня, приходите завтра"
-        )
-        return
-
-    messages = ["КРУТИМ БАРАБАН🥁", "Гадаем на бинарных опционах📊", "Анализируем лунный гороскоп🌚", "Лунная призма дай мне силу💫", "Сектор приз на барабане🎯"]
-    
-    for msg in messages:
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=msg
-        )
-        await asyncio.sleep(1.5)
+async def apply_selection(db: Session, selection: DailySelection) -> bool:
+    """
+    Начисляет очко выбранному пользователю и ставит кулдаун команды одной транзакцией.
+    Переводит выбор из pending в applied ровно один раз, даже при параллельных вызовах.
+    """
+    # Проверяем и создаем сезон если нужно
+    season_control = await ensure_season_exists(db)
+
+    claimed = db.query(DailySelection).filter(
+        DailySelection.id == selection.id,
+        DailySelection.status == 'pending'
+    ).update({DailySelection.status: 'applied'}, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        return False
 
-    user_id, display_name = await get_random_user(update)
-    if not user_id:
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="Недостаточно участников в чате"
+    count_field = 'run_count' if selection.command == '/run' else 'pidor_count'
+
+    user = db.query(User).filter(User.user_id == selection.user_id).first()
+    if not user:
+        user = User(user_id=selection.user_id, username=selection.username, **{count_field: 1})
+        db.add(user)
+    else:
+        setattr(user, count_field, getattr(user, count_field) + 1)
+        user.username = selection.username
+
+    # Создаем или обновляем статистику сезона
+    season_stat = db.query(SeasonStats).filter(
+        SeasonStats.season_id == season_control.current_season,
+        SeasonStats.user_id == selection.user_id
+    ).first()
+
+    if not season_stat:
+        season_stat = SeasonStats(
+            season_id=season_control.current_season,
+            user_id=selection.user_id,
+            username=selection.username,
+            run_count=0,
+            pidor_count=0,
+            sosal_count=0
         )
-        return
-
+        setattr(season_stat, count_field, 1)
+        db.add(season_stat)
+    else:
+        setattr(season_stat, count_field, getattr(season_stat, count_field) + 1)
+        season_stat.username = selection.username
+
+    # Кулдаун считается от момента выбора, а не объявления: вчерашний выбор не блокирует сегодняшний
+    record_command_usage(db, selection.chat_id, selection.command, used_at=selection.created_at)
+    db.commit()
+    return True
+
+async def announce_selection(bot, selection_id: int, message=None):
+    """
+    Применяет выбор (если еще не применен) и объявляет результат.
+    Если передано сообщение интриги, результат записывается в него, иначе
+    редактируется сохраненное сообщение или отправляется новое.
+    Повторный вызов для той же записи не начисляет очки повторно.
+    """
     db = SessionLocal()
     try:
-        # Проверяем и создаем сезон если нужно
-        season_control = await ensure_season_exists(db)
-        
-        user = db.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            user = User(user_id=user_id, username=display_name, run_count=1)
-            db.add(user)
-        else:
-            user.run_count += 1
-            user.username = display_name
-
-        # Создаем или обновляем статистику сезона
-        season_stat = db.query(SeasonStats).filter(
-            SeasonStats.season_id == season_control.current_season,
-            SeasonStats.user_id == user_id
-        ).first()
+        selection = db.get(DailySelection, selection_id)
+        if selection.status == 'pending':
+            await apply_selection(db, selection)
+            db.refresh(selection)
+        if selection.status == 'announced':
+            return
+        if message is not None:
+            selection.message_id = message.message_id
 
-        if not season_stat:
-            season_stat = SeasonStats(
-                season_id=season_control.current_season,
-                user_id=user_id,
-                username=display_name,
-                run_count=1,
-                pidor_count=0,
-                sosal_count=0
+        if selection.day < datetime.now(MOSCOW_TZ).date():
+            text = PAST_ANNOUNCEMENTS[selection.command].format(
+                name=f"@{selection.username}", day=selection.day.strftime('%d.%m.%Y')
             )
-            db.add(season_stat)
         else:
-            season_stat.run_count += 1
-            season_stat.username = display_name
-        
+            text = ANNOUNCEMENTS[selection.command].format(name=f"@{selection.username}")
+        if selection.message_id:
+            try:
+                await bot.edit_message_text(chat_id=selection.chat_id, message_id=selection.message_id, text=text)
+            except BadRequest as e:
+                # Сообщение уже содержит результат или было удалено
+                if "not modified" not in str(e).lower():
+                    sent = await bot.send_message(chat_id=selection.chat_id, text=text)
+                    selection.message_id = sent.message_id
+        else:
+            sent = await bot.send_message(chat_id=selection.chat_id, text=text)
+            selection.message_id = sent.message_id
+
+        selection.status = 'announced'
         db.commit()
-        await update_command_usage(update.effective_chat.id, '/run')
-        # Добавляем @ только если это username
-        name_with_prefix = f"@{display_name}" if user.username == display_name else display_name
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=f"🎉Красавчик сегодня - {name_with_prefix}🥳"
-        )
     finally:
         db.close()
 
-async def pidor_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not await check_command_cooldown(update.effective_chat.id, '/pidor', 24):
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="^^^Пидор сверху^^^"
-        )
+async def resume_pending_selections(bot):
+    """Объявляет выборы, которые не успели объявить до остановки бота"""
+    db = SessionLocal()
+    try:
+        selection_ids = [
+            selection_id for (selection_id,) in
+            db.query(DailySelection.id).filter(DailySelection.status != 'announced').all()
+        ]
+    finally:
+        db.close()
+
+    for selection_id in selection_ids:
+        try:
+            await announce_selection(bot, selection_id)
+            logger.info(f"Resumed announcement of selection {selection_id}")
+        except Exception as e:
+            logger.error(f"Failed to resume selection {selection_id}: {e}")
+
+async def announce_unfinished(bot, chat_id: int, command: str) -> bool:
+    """
+    Объявляет сегодняшний выбор, если он записан, но не объявлен и им не занят другой обработчик
+    (например, отправка результата упала с ошибкой Telegram). Возвращает True, если объявил.
+    """
+    db = SessionLocal()
+    try:
+        selection = db.query(DailySelection).filter(
+            DailySelection.chat_id == chat_id,
+            DailySelection.command == command,
+            DailySelection.day == datetime.now(MOSCOW_TZ).date(),
+            DailySelection.status != 'announced'
+        ).first()
+        selection_id = selection.id if selection else None
+    finally:
+        db.close()
+
+    if selection_id is None or selection_id in active_selections:
+        return False
+
+    active_selections.add(selection_id)
+    try:
+        await announce_selection(bot, selection_id)
+        return True
+    except TelegramError as e:
+        logger.error(f"Failed to announce unfinished selection {selection_id}: {e}")
+        return False
+    finally:
+        active_selections.discard(selection_id)
+
+async def play_daily_selection(update: Update, context: ContextTypes.DEFAULT_TYPE, command: str, messages: list, cooldown_text: str):
+    chat_id = update.effective_chat.id
+    if not await check_command_cooldown(chat_id, command, 24):
+        # Очки и кулдаун могли записаться, а объявление сорваться - тогда объявляем сейчас
+        if not await announce_unfinished(context.bot, chat_id, command):
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=cooldown_text
+            )
         return
 
-    messages = ["⚠️ВНИМАНИЕ⚠️", "ФЕДЕРАЛЬНЫЙ🔍РОЗЫСК🚨ПИДОРА", "Спутник запущен🚀", "Сводки👮Интерпола🚔проверены", "Твой🫵профиль в соцсетях👥проАНАЛизирован😨"]
-    
-    for msg in messages:
+    # Сначала фиксируем выбор, чтобы перезапуск во время интриги его не потерял
+    selection_id, created = await select_daily_user(update, command)
+    if not selection_id:
         await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=msg
+            chat_id=chat_id,
+            text="Недостаточно участников в чате"
         )
-        await asyncio.sleep(1.5)
-
-    user_id, display_name = await get_random_user(update)
-    if not user_id:
+        return
+    if selection_id in active_selections:
+        # Выбор на сегодня уже объявляет параллельный вызов
         await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="Недостаточно участников в чате"
+            chat_id=chat_id,
+            text=cooldown_text
         )
         return
+    if not created:
+        logger.info(f"Resuming unfinished selection {selection_id} in chat {chat_id}")
 
-    db = SessionLocal()
+    active_selections.add(selection_id)
     try:
-        # Проверяем и создаем сезон если нужно
-        season_control = await ensure_season_exists(db)
-        
-        user = db.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            user = User(user_id=user_id, username=display_name, pidor_count=1)
-            db.add(user)
-        else:
-            user.pidor_count += 1
-            user.username = display_name
+        message = None
+        try:
+            message = await start_suspense(context, chat_id, messages, selection_id)
+        except TelegramError as e:
+            # Без интриги результат просто придет отдельным сообщением
+            logger.warning(f"Suspense failed in chat {chat_id}: {e}")
+        await announce_selection(context.bot, selection_id, message)
+    finally:
+        active_selections.discard(selection_id)
 
-        # Создаем или обновляем статистику сезона
-        season_stat = db.query(SeasonStats).filter(
-            SeasonStats.season_id == season_control.current_season,
-            SeasonStats.user_id == user_id
-        ).first()
+async def run_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    messages = ["КРУТИМ БАРАБАН🥁", "Гадаем на бинарных опционах📊", "Анализируем лунный гороскоп🌚", "Лунная призма дай мне силу💫"]
+    await play_daily_selection(update, context, '/run', messages, "Красавчик уже был выбран сегодня, приходите завтра")
 
-        if not season_stat:
-            season_stat = SeasonStats(
-                season_id=season_control.current_season,
-                user_id=user_id,
-                username=display_name,
-                run_count=0,
-                pidor_count=1,
-                sosal_count=0
-            )
-            db.add(season_stat)
-        else:
-            season_stat.pidor_count += 1
-            season_stat.username = display_name
-        
-        db.commit()
-        await update_command_usage(update.effective_chat.id, '/pidor')
-        # Добавляем @ только если это username
-        name_with_prefix = f"@{display_name}" if user.username == display_name else display_name
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=f"🏳️‍🌈Сегодня ПИДОР ДНЯ - {name_with_prefix}👬"
-        )
-    finally:
-        db.close()
+async def pidor_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    messages = ["⚠️ВНИМАНИЕ⚠️", "ФЕДЕРАЛЬНЫЙ🔍РОЗЫСК🚨ПИДОРА", "Спутник запущен🚀", "Сводки👮Интерпола🚔проверены"]
+    await play_daily_selection(update, context, '/pidor', messages, "^^^Пидор сверху^^^")
 
 async def sosal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -671,14 +951,61 @@ async def startseason_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     finally:
         db.close()
 
+def cancel_inflight():
+    pending = [task for task in inflight_tasks | suspense_tasks if not task.done()]
+    if pending:
+        # Незавершенные выборы останутся в статусе pending и будут объявлены после запуска
+        logger.warning(f"Shutdown timeout exceeded, cancelling {len(pending)} in-flight tasks")
+    for task in pending:
+        task.cancel()
+
+def request_shutdown(application: Application):
+    # Событие выставляется только когда остановка действительно началась, повторные сигналы ее не ускоряют
+    if shutdown_event.is_set():
+        return
+    logger.info("Shutdown requested")
+    shutdown_event.set()
+
+    if not application.running:
+        # Бот еще запускается (например, в resume_pending_selections), stop_running тут ничего не сделает.
+        # Как и встроенная обработка stop_signals в PTB, выходим через SystemExit - run_polling
+        # поймает его и корректно завершит приложение, а необъявленные выборы подхватит следующий запуск
+        raise SystemExit
+
+    # Анимации интриги увидят событие и завершатся досрочно.
+    # Прекращаем прием обновлений, Application.stop дождется уже начатых обработчиков
+    application.stop_running()
+    asyncio.get_running_loop().call_later(SHUTDOWN_TIMEOUT, cancel_inflight)
+
+async def post_init(application: Application):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, request_shutdown, application)
+    await resume_pending_selections(application.bot)
+
+async def post_shutdown(application: Application):
+    # Все записи коммитятся в обработчиках, остается закрыть соединения пула
+    engine.dispose()
+    logger.info("Bot stopped")
+
 def main():
     # Ждем подключения к базе данных
     wait_for_db()
     
-    application = Application.builder().token(BOT_TOKEN).build()
-
-    application.add_handler(CommandHandler("run", run_command))
-    application.add_handler(CommandHandler("pidor", pidor_command))
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # Троттлинг в группе -1 выполняется раньше всех обработчиков команд
+    application.add_handler(TypeHandler(Update, throttle_updates), group=-1)
+
+    # Выбор выполняется в отдельных задачах, чтобы при остановке их можно было дождаться с таймаутом
+    application.add_handler(CommandHandler("run", track_inflight(run_command), block=False))
+    application.add_handler(CommandHandler("pidor", track_inflight(pidor_command), block=False))
     application.add_handler(CommandHandler("sosal", sosal_command))
     application.add_handler(CommandHandler("nesosal", nesosal_command))
     application.add_handler(CommandHandler("stats", stats_command))
@@ -691,7 +1018,8 @@ def main():
     application.add_handler(CallbackQueryHandler(handle_season_callback))
 
     logger.info("Bot started")
-    application.run_polling()
+    # Сигналы обрабатываем сами в post_init, чтобы успеть прервать анимации до остановки
+    application.run_polling(stop_signals=None)
 
 if __name__ == "__main__":
     main()
@@ -1,19 +1,74 @@
-from sqlalchemy import create_engine, Column, Integer, String, BigInteger, DateTime, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, BigInteger, DateTime, Boolean, Date, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.types import TypeDecorator
 import os
 from datetime import datetime
 import pytz
 
-DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-
-engine = create_engine(DATABASE_URL)
+# DATABASE_URL позволяет запустить бота на SQLite, например sqlite:///bot.db или sqlite:///:memory:
+DATABASE_URL = os.getenv('DATABASE_URL') or f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    'cache_size': -16000,
+}
+
+def create_db_engine(url: str):
+    """Создает движок с настройками под конкретную СУБД"""
+    if not url.startswith('sqlite'):
+        return create_engine(url)
+
+    in_memory = url in ('sqlite://', 'sqlite:///:memory:')
+    if in_memory:
+        # Одно соединение на весь процесс, иначе каждая сессия увидит свою пустую базу
+        sqlite_engine = create_engine(url, connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    else:
+        # Обычный пул держит соединения открытыми, так что PRAGMA выполняются один раз на соединение
+        sqlite_engine = create_engine(url)
+
+    @event.listens_for(sqlite_engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            if in_memory and pragma == 'journal_mode':
+                continue
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+    return sqlite_engine
+
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
+class TZDateTime(TypeDecorator):
+    """
+    DateTime с часовым поясом, который одинаково работает на PostgreSQL и SQLite.
+    SQLite не хранит пояс, поэтому время сохраняется в UTC и возвращается aware.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(pytz.utc)
+            if dialect.name == 'sqlite':
+                value = value.replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=pytz.utc)
+        return value
+
 class User(Base):
     __tablename__ = "users"
 
@@ -29,8 +84,8 @@ class Season(Base):
 
     id = Column(Integer, primary_key=True)
     season_number = Column(Integer, nullable=False)
-    start_date = Column(DateTime(timezone=True), nullable=False)
-    end_date = Column(DateTime(timezone=True), nullable=True)
+    start_date = Column(TZDateTime(), nullable=False)
+    end_date = Column(TZDateTime(), nullable=True)
 
 class SeasonStats(Base):
     __tablename__ = "season_stats"
@@ -49,14 +104,40 @@ class CommandUsage(Base):
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, nullable=False)
     command = Column(String, nullable=False)
-    last_used = Column(DateTime(timezone=True), nullable=False)
+    last_used = Column(TZDateTime(), nullable=False)
     user_id = Column(BigInteger, nullable=True)
 
+class DailySelection(Base):
+    __tablename__ = "daily_selections"
+    __table_args__ = (UniqueConstraint('chat_id', 'command', 'day'),)
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    command = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    seed = Column(BigInteger, nullable=False)
+    salt_id = Column(Integer, nullable=False)
+    roster = Column(Text, nullable=False)
+    weighted = Column(Boolean, default=False)
+    user_id = Column(BigInteger, nullable=False)
+    username = Column(String, nullable=True)
+    # pending -> applied (очки и кулдаун записаны) -> announced (результат отправлен)
+    status = Column(String, nullable=False, default='pending')
+    message_id = Column(BigInteger, nullable=True)
+    created_at = Column(TZDateTime(), nullable=False)
+
+class SelectionSalt(Base):
+    __tablename__ = "selection_salts"
+
+    id = Column(Integer, primary_key=True)
+    salt = Column(String, unique=True, nullable=False)
+    created_at = Column(TZDateTime(), nullable=False)
+
 class SeasonControl(Base):
     __tablename__ = "season_control"
 
     id = Column(Integer, primary_key=True)
-    last_clear = Column(DateTime(timezone=True), nullable=True)
+    last_clear = Column(TZDateTime(), nullable=True)
     current_season = Column(Integer, default=0)
     is_active = Column(Boolean, default=False)
 
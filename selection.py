@@ -0,0 +1,90 @@
+import hashlib
+import os
+import random
+import secrets
+from datetime import date
+
+# Если соль не задана, бот генерирует ее сам и хранит в таблице selection_salts
+SELECTION_SALT = os.getenv('SELECTION_SALT')
+FAIRNESS_WEIGHTING = os.getenv('FAIRNESS_WEIGHTING', 'false').lower() in ('1', 'true', 'yes')
+
+class AliasTable:
+    """
+    Таблица псевдонимов (метод Воуза) для взвешенной выборки за O(1).
+    Строится один раз за O(n), после чего каждая выборка стоит два вызова ГПСЧ.
+    """
+
+    def __init__(self, weights: tuple):
+        n = len(weights)
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            raise ValueError("Нужен хотя бы один кандидат с положительным весом")
+
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Остатки из-за погрешности округления получают вероятность 1
+
+    def sample(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+def generate_salt() -> str:
+    return secrets.token_hex(32)
+
+def make_seed(salt: str, chat_id: int, command: str, day: date) -> int:
+    """
+    Сид выбора для чата, команды и дня (63 бита, чтобы поместиться в BigInteger).
+    Секретная соль не дает участникам заранее вычислить победителя по списку админов и /stats.
+    """
+    payload = f"{salt}:{chat_id}:{command}:{day.isoformat()}".encode()
+    return int.from_bytes(hashlib.sha256(payload).digest()[:8], 'big') >> 1
+
+def candidate_weights(counts: tuple, weighted: bool) -> tuple:
+    """Вес кандидата обратно пропорционален числу прошлых побед"""
+    if not weighted:
+        return tuple(1.0 for _ in counts)
+    return tuple(1.0 / (1 + count) for count in counts)
+
+def pick_index(seed: int, counts: tuple, weighted: bool) -> int:
+    """
+    Индекс победителя для сида и прошлых побед кандидатов.
+    Таблица не кэшируется: счетчики меняются после каждого выбора, а на выбор приходится
+    одна выборка, так что основная стоимость - построение таблицы за O(n).
+    """
+    table = AliasTable(candidate_weights(counts, weighted))
+    return table.sample(random.Random(seed))
+
+def encode_roster(user_ids: list, counts: list) -> str:
+    return ",".join(f"{user_id}:{count}" for user_id, count in zip(user_ids, counts))
+
+def decode_roster(roster: str) -> tuple:
+    user_ids, counts = [], []
+    for item in roster.split(","):
+        user_id, count = item.split(":")
+        user_ids.append(int(user_id))
+        counts.append(int(count))
+    return user_ids, tuple(counts)
+
+def verify_selection(selection, salt: str) -> bool:
+    """
+    Повторяет выбор по сохраненным сиду и составу участников и сверяет результат.
+    salt - соль, действовавшая в момент выбора (selection.salt_id).
+    """
+    if selection.seed != make_seed(salt, selection.chat_id, selection.command, selection.day):
+        return False
+    user_ids, counts = decode_roster(selection.roster)
+    return user_ids[pick_index(selection.seed, counts, selection.weighted)] == selection.user_id
@@ -0,0 +1,66 @@
+import time
+
+class TokenBucket:
+    """Корзина токенов: capacity запросов подряд, затем один запрос каждые period / capacity секунд"""
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: int, period: float, now: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def is_idle(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class Throttle:
+    """
+    Ограничение частоты команд в памяти процесса.
+    Лимиты задаются словарями {команда: (capacity, period)} отдельно для пользователя и для чата,
+    команда пропускается только если токены есть в обеих корзинах.
+    default_limit применяется к пользователю для команд, которых нет в user_limits.
+    """
+
+    def __init__(self, user_limits: dict, chat_limits: dict, default_limit: tuple = None, max_buckets: int = 10000):
+        self.user_limits = user_limits
+        self.chat_limits = chat_limits
+        self.default_limit = default_limit
+        self.max_buckets = max_buckets
+        self.buckets = {}
+
+    def _bucket(self, key: tuple, limit: tuple, now: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self._evict_idle(now)
+            bucket = self.buckets[key] = TokenBucket(*limit, now)
+        return bucket
+
+    def _evict_idle(self, now: float):
+        # Полностью восстановившиеся корзины ничем не отличаются от новых
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_idle(now)]:
+            del self.buckets[key]
+
+    def allow(self, command: str, chat_id: int, user_id: int = None) -> bool:
+        now = time.monotonic()
+        buckets = []
+
+        user_limit = self.user_limits.get(command, self.default_limit)
+        if user_limit and user_id is not None:
+            buckets.append(self._bucket(('user', chat_id, user_id, command), user_limit, now))
+
+        chat_limit = self.chat_limits.get(command)
+        if chat_limit:
+            buckets.append(self._bucket(('chat', chat_id, command), chat_limit, now))
+
+        # Списываем токены только если хватает во всех корзинах
+        if any(bucket.refill(now) < 1 for bucket in buckets):
+            return False
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return True